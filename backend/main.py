@@ -1,32 +1,67 @@
-from fastapi import FastAPI, UploadFile, HTTPException, File, Request
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, UploadFile, HTTPException, File, Request, Depends, BackgroundTasks
+from fastapi.responses import JSONResponse, FileResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse
 from fastapi.middleware.gzip import GZipMiddleware
+from starlette.datastructures import Headers
 import os
-import shutil
+import stat
 import uuid
+import hashlib
 import pdfplumber
 import pandas as pd
 import cv2
 import numpy as np
 import pytesseract
+from pytesseract import Output
 from PIL import Image
 import io
-from typing import List, Dict, Optional, Any
-import xml.etree.ElementTree as ET
+import re
+import math
+import csv
+import threading
+import tempfile
+import zipfile
+from typing import List, Dict, Optional, Any, Iterable, Iterator, BinaryIO, Union
+from xml.sax.saxutils import escape
+import time
 from datetime import datetime
-import aiofiles
-import json
-from pydantic import BaseModel
+import orjson
+from pydantic import BaseModel, PrivateAttr
 import asyncio
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+import multiprocessing as mp
+from itertools import chain
 import logging
 import sys
 import traceback
 import uvicorn
 import mimetypes
 
+try:
+    from pyexcelerate import Workbook as ExcelWorkbook
+except ImportError:  # fall back to openpyxl's write-only mode
+    ExcelWorkbook = None
+    from openpyxl import Workbook
+
+try:
+    import pymupdf
+except ImportError:  # pdfplumber does all table extraction
+    pymupdf = None
+
+try:
+    from tesserocr import PyTessBaseAPI, PSM, OEM
+except ImportError:  # fall back to running the tesseract CLI through pytesseract
+    PyTessBaseAPI = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:  # fall back to pandas' CSV writer
+    pa = None
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -35,10 +70,41 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Tesseract's OpenMP threading is slower than running single-threaded
+# OCR jobs side by side in the process pool
+os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+# Same for OpenCV's own thread pool, which would otherwise start a thread
+# per core in every pool worker
+cv2.setNumThreads(1)
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered by orjson"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+        )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start the pool workers before the server spins up its own threads
+    await asyncio.wrap_future(pool_submit(os.getpid))
+    index_uploads()
+    ocr_batcher.start()
+    cache_cleaner = asyncio.create_task(expire_table_cache())
+    yield
+    cache_cleaner.cancel()
+    await ocr_batcher.stop()
+    process_pool.shutdown()
+
 app = FastAPI(
     title="PDF Tally Converter API",
     description="API for converting PDF files",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # Add CORS middleware before any routes
@@ -55,8 +121,42 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Add GZip compression
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+# Text formats worth gzipping on the way out; xlsx is already a zip
+# archive and PDFs/images are compressed too
+COMPRESSIBLE_TYPES = {"application/json", "application/xml", "text/csv", "text/xml", "text/plain", "text/html"}
+
+class CompressibleGZipMiddleware:
+    """GZipMiddleware applied only to COMPRESSIBLE_TYPES responses"""
+    
+    def __init__(self, app, minimum_size: int = 500, compresslevel: int = 9):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compresslevel = compresslevel
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        async def route(scope, receive, gzip_send):
+            # Once the response's type is known, send other types past gzip
+            target = gzip_send
+            
+            async def route_send(message):
+                nonlocal target
+                if message["type"] == "http.response.start":
+                    content_type = Headers(raw=message["headers"]).get("content-type", "")
+                    if content_type.partition(";")[0].strip().lower() not in COMPRESSIBLE_TYPES:
+                        target = send
+                await target(message)
+            
+            await self.app(scope, receive, route_send)
+        
+        gzip = GZipMiddleware(route, minimum_size=self.minimum_size, compresslevel=self.compresslevel)
+        await gzip(scope, receive, send)
+
+# Add GZip compression for text responses
+app.add_middleware(CompressibleGZipMiddleware, minimum_size=1000, compresslevel=6)
 
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
@@ -68,7 +168,7 @@ async def log_requests(request: Request, call_next):
     except Exception as e:
         logger.error(f"Request failed: {str(e)}")
         logger.error(traceback.format_exc())
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=500,
             content={"detail": "Internal server error", "error": str(e)}
         )
@@ -78,16 +178,20 @@ async def test():
     """Test endpoint to verify the API is working"""
     return {"message": "API is working!"}
 
+# Environment variables /debug may show; the rest can hold secrets
+DEBUG_ENV_VARS = ('PYTHONPATH', 'LANG', 'TZ', 'OMP_THREAD_LIMIT')
+
 @app.get("/debug")
 async def debug(request: Request):
-    """Debug endpoint to show environment information"""
+    """Debug endpoint to show environment information, enabled by DEBUG_ENDPOINT"""
+    if not os.getenv('DEBUG_ENDPOINT'):
+        raise HTTPException(status_code=404, detail="Not Found")
     return {
         "cwd": os.getcwd(),
         "files_in_cwd": os.listdir(),
-        "python_path": sys.path,
-        "env_vars": dict(os.environ),
-        "request_url": str(request.url),
-        "request_headers": dict(request.headers)
+        "python_version": sys.version_info[:3],
+        "env_vars": {key: os.environ[key] for key in DEBUG_ENV_VARS if key in os.environ},
+        "request_url": str(request.url)
     }
 
 @app.get("/")
@@ -121,13 +225,65 @@ async def health_check():
 
 # Create necessary directories
 UPLOAD_DIR = "uploads"
+IMAGE_EXTENSIONS = frozenset({'.png', '.jpg', '.jpeg'})
+UPLOAD_EXTENSIONS = IMAGE_EXTENSIONS | {'.pdf'}
 CONVERTED_DIR = "converted"
-CHUNK_SIZE = 1024 * 1024  # 1MB chunks for file handling
+CORRECTED_DIR = "corrected"
+CACHE_DIR = "cache"
+TABLE_CACHE_TTL = 60 * 60  # Seconds a parsed upload stays reusable
+CHUNK_SIZE = 8 * 1024 * 1024  # 8MB chunks for file handling
+OCR_MAX_SIDE = 2000  # Downscale larger images before OCR
+XLSX_STREAM_ROWS = 50_000  # Larger workbooks skip the xlsx library
+# LSTM engine, uniform block of text; the input is binarized black on
+# white, so skip Tesseract's inverted-text check (CLI fallback)
+TESSERACT_CONFIG = '--oem 1 --psm 6 -c tessedit_do_invert=0'
+OCR_BATCH_SIZE = 4  # Images OCR'd together in one pool call
+OCR_BATCH_TIMEOUT = 0.05  # Seconds to wait for a batch to fill
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(CONVERTED_DIR, exist_ok=True)
+os.makedirs(CORRECTED_DIR, exist_ok=True)
+os.makedirs(CACHE_DIR, exist_ok=True)
 
-# Initialize process pool for CPU-intensive tasks
-process_pool = ProcessPoolExecutor()
+def _init_worker():
+    """Process pool initializer"""
+    os.environ['OMP_THREAD_LIMIT'] = '1'
+    # Load the Tesseract models now rather than on the worker's first image
+    if PyTessBaseAPI is not None:
+        try:
+            with _tess_lock:
+                get_tess_api()
+        except Exception as e:
+            logger.warning(f"Could not start Tesseract engine in worker: {str(e)}")
+
+# Initialize process pool for CPU-intensive tasks. On Linux the workers are
+# forked so they inherit pdfplumber, cv2, pandas and pytesseract already
+# imported above instead of importing them again.
+POOL_WORKERS = min(8, os.cpu_count() or 4)
+
+def _new_process_pool() -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(
+        max_workers=POOL_WORKERS,
+        mp_context=mp.get_context('fork' if sys.platform.startswith('linux') else None),
+        initializer=_init_worker
+    )
+
+process_pool = _new_process_pool()
+_process_pool_lock = threading.Lock()
+
+def pool_submit(fn, *args) -> Future:
+    """Submit a call to the process pool, replacing the pool if a worker died"""
+    global process_pool
+    pool = process_pool
+    try:
+        return pool.submit(fn, *args)
+    except BrokenProcessPool:
+        # A killed worker (e.g. by the OOM killer) breaks the whole pool
+        with _process_pool_lock:
+            if process_pool is pool:
+                logger.warning("Process pool is broken, starting a new one")
+                process_pool = _new_process_pool()
+                pool.shutdown(wait=False)
+        return process_pool.submit(fn, *args)
 
 class ConversionError(Exception):
     pass
@@ -151,10 +307,25 @@ class TableRow(BaseModel):
 class TableData(BaseModel):
     headers: List[str]
     rows: List[TableRow]
+    _dataframe: Optional[pd.DataFrame] = PrivateAttr(default=None)
+    _values: Optional[List[List[Any]]] = PrivateAttr(default=None)
 
     class Config:
         arbitrary_types_allowed = True
 
+    def to_rows(self) -> List[List[Any]]:
+        """Row-wise cell values in header order, the layout xlsx writers take"""
+        if self._values is None:
+            self._values = [[row.cells[header].value for header in self.headers] for row in self.rows]
+        return self._values
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """DataFrame of the cell values, built once from to_rows() and cached"""
+        if self._dataframe is None:
+            # Keep the edited values exactly as sent, without dtype inference
+            self._dataframe = pd.DataFrame(self.to_rows(), columns=self.headers, dtype=object)
+        return self._dataframe
+
 class EditHistory(BaseModel):
     timestamp: int
     rowId: str
@@ -168,17 +339,63 @@ class SavePayload(BaseModel):
     modifiedData: TableData
     editHistory: List[EditHistory]
 
+def _copy_upload(src: BinaryIO, dst_path: str) -> str:
+    """Copy an upload's spool file to dst_path, returning its SHA-256 hex digest"""
+    digest = hashlib.sha256()
+    with open(dst_path, 'wb') as dst:
+        # The hash has to see every byte anyway, so hash and write the
+        # same chunks in one pass rather than copying inside the kernel
+        while chunk := src.read(CHUNK_SIZE):
+            digest.update(chunk)
+            dst.write(chunk)
+    return digest.hexdigest()
+
+def _file_digest(file_path: str) -> str:
+    """SHA-256 hex digest of a file on disk"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Threads for the output writers convert_file runs side by side
+writer_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="writer")
+
+# Uploaded file paths by file_id, so lookups don't probe every extension
+UPLOADS: Dict[str, str] = {}
+
+# Content hash of each upload by file_id, the key of its cached table.
+# Kept after the upload is removed so it can still be converted again
+# from the cache, and pruned along with the cache
+UPLOAD_DIGESTS: Dict[str, str] = {}
+
+def index_uploads():
+    """Index the files already in the upload directory"""
+    with os.scandir(UPLOAD_DIR) as entries:
+        for entry in entries:
+            file_id, ext = os.path.splitext(entry.name)
+            if ext in UPLOAD_EXTENSIONS and entry.is_file():
+                UPLOADS[file_id] = entry.path
+
+def remove_upload(file_id: str, file_path: str):
+    """Delete an uploaded file and drop it from the index"""
+    UPLOADS.pop(file_id, None)
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        # Converted and removed by a concurrent request for the same id
+        pass
+
 async def save_upload_file(upload_file: UploadFile) -> tuple[str, str]:
     """Save uploaded file and return the file path"""
     file_id = str(uuid.uuid4())
-    file_extension = os.path.splitext(upload_file.filename)[1]
+    # Lowercased so index_uploads and find_upload recognise it later
+    file_extension = os.path.splitext(upload_file.filename)[1].lower()
     file_path = os.path.join(UPLOAD_DIR, f"{file_id}{file_extension}")
     
     try:
-        async with aiofiles.open(file_path, 'wb') as out_file:
-            while chunk := await upload_file.read(CHUNK_SIZE):
-                await out_file.write(chunk)
-        
+        UPLOAD_DIGESTS[file_id] = await asyncio.to_thread(_copy_upload, upload_file.file, file_path)
+        UPLOADS[file_id] = file_path
         return file_path, file_id
     except Exception as e:
         # Clean up the file if there's an error
@@ -186,115 +403,624 @@ async def save_upload_file(upload_file: UploadFile) -> tuple[str, str]:
             os.remove(file_path)
         raise HTTPException(status_code=500, detail=str(e))
 
-def extract_tables_from_pdf(file_path: str) -> List[pd.DataFrame]:
-    """Extract tables from PDF using pdfplumber"""
-    tables = []
+async def upload_digest(file_id: str, file_path: Optional[str]) -> str:
+    """Content hash of an upload, hashing the file if it came through another worker"""
+    digest = UPLOAD_DIGESTS.get(file_id)
+    if digest is None:
+        if file_path is None:
+            raise HTTPException(status_code=404, detail="File not found")
+        digest = UPLOAD_DIGESTS[file_id] = await asyncio.to_thread(_file_digest, file_path)
+    return digest
+
+def open_pdf(file_path: str):
+    """Open a PDF with PyMuPDF when available, pdfplumber otherwise"""
+    return pymupdf.open(file_path) if pymupdf is not None else pdfplumber.open(file_path)
+
+def pdf_page_count(pdf) -> int:
+    return pdf.page_count if pymupdf is not None else len(pdf.pages)
+
+def _extract_page_tables(file_path: str, pages: range) -> List[pd.DataFrame]:
+    """Extract the tables of a run of PDF pages (runs inside a process pool worker)"""
+    page_tables: Dict[int, List[pd.DataFrame]] = {}
+    if pymupdf is not None:
+        # MuPDF's C table finder, pdfplumber only for pages it finds nothing on
+        with pymupdf.open(file_path) as doc:
+            for page_no in pages:
+                rows = [table.extract() for table in doc[page_no].find_tables()]
+                tables = [pd.DataFrame(table[1:], columns=table[0]) for table in rows if table]
+                if tables:
+                    page_tables[page_no] = tables
+    
+    missing = [page_no for page_no in pages if page_no not in page_tables]
+    if missing:
+        # Only build page objects for the pages we need
+        with pdfplumber.open(file_path, pages=[page_no + 1 for page_no in missing]) as pdf:
+            for page_no, page in zip(missing, pdf.pages):
+                page_tables[page_no] = [
+                    pd.DataFrame(table[1:], columns=table[0])
+                    for table in page.extract_tables()
+                    if table  # Check if table is not empty
+                ]
+    return [table for page_no in pages for table in page_tables[page_no]]
+
+def iter_pdf_tables(file_path: str, page_count: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """Yield the tables of a PDF in page order, pages split into runs over the pool workers"""
     try:
-        with pdfplumber.open(file_path) as pdf:
-            for page in pdf.pages:
-                page_tables = page.extract_tables()
-                for table in page_tables:
-                    if table:  # Check if table is not empty
-                        df = pd.DataFrame(table[1:], columns=table[0])
-                        tables.append(df)
+        if page_count is None:
+            with open_pdf(file_path) as pdf:
+                page_count = pdf_page_count(pdf)
+        step = max(1, -(-page_count // (POOL_WORKERS * 4)))
+        page_runs = [range(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+        runs = [pool_submit(_extract_page_tables, file_path, pages) for pages in page_runs]
+        for run in runs:
+            yield from run.result()
     except Exception as e:
         raise ConversionError(f"Failed to extract tables from PDF: {str(e)}")
-    return tables
+
+def extract_tables_from_pdf(file_path: str, page_count: Optional[int] = None) -> List[pd.DataFrame]:
+    """Extract tables from PDF, pages spread over the pool workers"""
+    return list(iter_pdf_tables(file_path, page_count))
+
+class PdfContext:
+    """An uploaded PDF opened at most once per request, with its tables cached"""
+    
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._pdf = None
+        self._tables: Optional[List[pd.DataFrame]] = None
+    
+    @property
+    def pdf(self):
+        if self._pdf is None:
+            self._pdf = open_pdf(self.file_path)
+        return self._pdf
+    
+    def tables(self) -> List[pd.DataFrame]:
+        """Tables of every page, extracted on first use"""
+        if self._tables is None:
+            try:
+                page_count = pdf_page_count(self.pdf)
+            except Exception as e:
+                raise ConversionError(f"Failed to extract tables from PDF: {str(e)}")
+            self._tables = extract_tables_from_pdf(self.file_path, page_count)
+        return self._tables
+    
+    def close(self):
+        if self._pdf is not None:
+            self._pdf.close()
+            self._pdf = None
+
+def find_upload(file_id: str) -> Optional[str]:
+    """Path of an uploaded file, whatever its extension"""
+    file_path = UPLOADS.get(file_id)
+    if file_path is not None:
+        return file_path
+    # Uploaded through another server worker, look on disk once
+    for ext in UPLOAD_EXTENSIONS:
+        file_path = os.path.join(UPLOAD_DIR, f"{file_id}{ext}")
+        if os.path.exists(file_path):
+            UPLOADS[file_id] = file_path
+            return file_path
+    return None
+
+async def get_pdf_context(file_id: str):
+    """Dependency yielding a PdfContext for uploaded PDFs, None otherwise"""
+    file_path = find_upload(file_id)
+    if file_path is None or not file_path.endswith('.pdf'):
+        yield None
+        return
+    ctx = PdfContext(file_path)
+    try:
+        yield ctx
+    finally:
+        ctx.close()
+
+def _decode_image(image: Union[str, bytes]) -> np.ndarray:
+    """Decode an image file path or in-memory image straight to grayscale"""
+    # Skips the BGR decode and conversion
+    try:
+        if isinstance(image, bytes):
+            gray = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_GRAYSCALE)
+        else:
+            gray = cv2.imread(image, cv2.IMREAD_GRAYSCALE)
+    except cv2.error:
+        gray = None
+    if gray is None:
+        raise ConversionError("Failed to read image file")
+    return gray
 
 def process_image_ocr(file_path: str) -> pd.DataFrame:
     """Process image using OCR to extract tabular data"""
-    try:
-        # Read image
-        img = cv2.imread(file_path)
-        if img is None:
-            raise ConversionError("Failed to read image file")
+    return _ocr_table(_decode_image(file_path))
 
-        # Convert to grayscale
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        # OCR
-        text = pytesseract.image_to_string(gray)
-        
-        # Convert OCR text to DataFrame
-        # This is a simple implementation - you might need to enhance it based on your needs
-        lines = text.strip().split('\n')
-        if not lines:
-            raise ConversionError("No text detected in image")
-            
-        # Assume first line contains headers
-        headers = lines[0].split()
-        data = [line.split() for line in lines[1:]]
+# Columns of Tesseract's TSV output, which tesserocr returns without a header line
+TSV_COLUMNS = ['level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+               'left', 'top', 'width', 'height', 'conf', 'text']
+
+# One Tesseract engine per process so the models are loaded once; the
+# engine itself is not thread-safe
+_tess_api = None
+_tess_lock = threading.Lock()
+
+def get_tess_api() -> "PyTessBaseAPI":
+    """This process's Tesseract engine, created on first use (call under _tess_lock)"""
+    global _tess_api
+    if _tess_api is None:
+        _tess_api = PyTessBaseAPI(lang='eng', psm=PSM.SINGLE_BLOCK, oem=OEM.LSTM_ONLY)
+        _tess_api.SetVariable('tessedit_do_invert', '0')
+    return _tess_api
+
+def _ocr_words(bw: np.ndarray) -> pd.DataFrame:
+    """Tesseract word boxes of a binarized image, text kept as strings"""
+    if PyTessBaseAPI is None:
+        return pytesseract.image_to_data(
+            bw,
+            config=TESSERACT_CONFIG,
+            output_type=Output.DATAFRAME,
+            pandas_config={'dtype': {'text': str}, 'keep_default_na': False}
+        )
+    
+    with _tess_lock:
+        api = get_tess_api()
+        api.SetImage(Image.fromarray(bw))
+        tsv = api.GetTSVText(0)
+    if not tsv.strip():
+        return pd.DataFrame(columns=TSV_COLUMNS)
+    return pd.read_csv(
+        io.StringIO(tsv),
+        sep='\t',
+        names=TSV_COLUMNS,
+        quoting=csv.QUOTE_NONE,
+        dtype={'text': str},
+        keep_default_na=False
+    )
+
+def _ocr_words_batch(images: List[np.ndarray]) -> List[pd.DataFrame]:
+    """Word boxes of several binarized images from a single tesseract run"""
+    if PyTessBaseAPI is not None or len(images) <= 1:
+        return [_ocr_words(bw) for bw in images]
+    
+    # Tesseract reads a text file as a list of images and numbers the
+    # TSV pages in list order, so one process serves the whole batch
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = []
+        for n, bw in enumerate(images):
+            path = os.path.join(tmp_dir, f"{n}.png")
+            cv2.imwrite(path, bw)
+            paths.append(path)
+        list_path = os.path.join(tmp_dir, "images.txt")
+        with open(list_path, 'w') as f:
+            f.write('\n'.join(paths))
+        words = pytesseract.image_to_data(
+            list_path,
+            config=TESSERACT_CONFIG,
+            output_type=Output.DATAFRAME,
+            pandas_config={'dtype': {'text': str}, 'keep_default_na': False}
+        )
+    return [words[words.page_num == n + 1] for n in range(len(images))]
+
+def _binarize(gray: np.ndarray) -> np.ndarray:
+    """Prepare a grayscale image for Tesseract"""
+    # Shrink oversized scans; Tesseract's own rescaling costs more
+    if max(gray.shape) > OCR_MAX_SIDE:
+        scale = OCR_MAX_SIDE / max(gray.shape)
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    
+    # Binarize so Tesseract skips its own thresholding and noise passes
+    return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 10)
+
+def _words_to_table(words: pd.DataFrame) -> pd.DataFrame:
+    """Rebuild a table from OCR word boxes, first line as headers"""
+    words = words[(words.conf > 0) & (words.text.str.strip() != '')]
+    if words.empty:
+        raise ConversionError("No text detected in image")
+    
+    # Rebuild table rows from Tesseract's own line layout. Words come in
+    # reading order, so each line is a run of equal (block, par, line)
+    # keys and can be cut out with numpy instead of a Python groupby
+    keys = words[['block_num', 'par_num', 'line_num']].to_numpy()
+    line_starts = np.flatnonzero((keys[1:] != keys[:-1]).any(axis=1)) + 1
+    lines = [line.tolist() for line in np.split(words['text'].to_numpy(dtype=object), line_starts)]
         
-        return pd.DataFrame(data, columns=headers)
+    # Assume first line contains headers
+    headers = lines[0]
+    data = lines[1:]
+    
+    return pd.DataFrame(data, columns=headers)
+
+def _ocr_table(gray: np.ndarray) -> pd.DataFrame:
+    """OCR a grayscale image into a DataFrame, first line as headers"""
+    try:
+        return _words_to_table(_ocr_words(_binarize(gray)))
     except Exception as e:
         raise ConversionError(f"Failed to process image: {str(e)}")
 
-def create_tally_xml(data: pd.DataFrame, filename: str) -> str:
-    """Create Tally-compatible XML from DataFrame"""
-    root = ET.Element("ENVELOPE")
-    header = ET.SubElement(root, "HEADER")
-    ET.SubElement(header, "VERSION").text = "1"
-    ET.SubElement(header, "TALLYREQUEST").text = "Import Data"
+def process_images_ocr(images: List[Union[str, bytes]]) -> List[Union[pd.DataFrame, ConversionError]]:
+    """OCR a batch of images in one pool worker, returning a table or ConversionError per image"""
+    results: List[Union[pd.DataFrame, ConversionError, None]] = [None] * len(images)
+    ready = {}
+    for n, image in enumerate(images):
+        try:
+            ready[n] = _binarize(_decode_image(image))
+        except ConversionError as e:
+            results[n] = e
+        except Exception as e:
+            results[n] = ConversionError(f"Failed to process image: {str(e)}")
     
-    body = ET.SubElement(root, "BODY")
-    importdata = ET.SubElement(body, "IMPORTDATA")
-    requestdesc = ET.SubElement(importdata, "REQUESTDESC")
-    reportname = ET.SubElement(requestdesc, "REPORTNAME").text = "Custom"
+    try:
+        words = dict(zip(ready, _ocr_words_batch(list(ready.values()))))
+    except Exception as e:
+        words = {}
+        for n in ready:
+            results[n] = ConversionError(f"Failed to process image: {str(e)}")
+    
+    for n, image_words in words.items():
+        try:
+            results[n] = _words_to_table(image_words)
+        except Exception as e:
+            results[n] = ConversionError(f"Failed to process image: {str(e)}")
+    return results
+
+class OcrBatcher:
+    """Coalesces OCR requests arriving close together into one pool call"""
+    
+    def __init__(self, max_size: int = OCR_BATCH_SIZE, timeout: float = OCR_BATCH_TIMEOUT):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._batches = set()
     
-    requestdata = ET.SubElement(importdata, "REQUESTDATA")
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._runner = asyncio.create_task(self._run())
     
-    # Convert DataFrame to XML structure
-    for _, row in data.iterrows():
-        tallymessage = ET.SubElement(requestdata, "TALLYMESSAGE")
-        for col, value in row.items():
-            ET.SubElement(tallymessage, str(col)).text = str(value)
+    async def stop(self):
+        if self._runner is not None:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, *self._batches, return_exceptions=True)
+            self._runner = None
+        self._queue = None
     
-    # Save XML file
-    xml_path = os.path.join(CONVERTED_DIR, f"{filename}.xml")
-    tree = ET.ElementTree(root)
-    tree.write(xml_path, encoding='utf-8', xml_declaration=True)
+    async def ocr(self, image: Union[str, bytes]) -> pd.DataFrame:
+        """OCR one image path or in-memory image"""
+        loop = asyncio.get_running_loop()
+        if self._queue is None or PyTessBaseAPI is not None:
+            # Not started (no lifespan) or nothing to save by batching,
+            # OCR on its own so concurrent images use separate workers
+            [result] = await asyncio.wrap_future(pool_submit(process_images_ocr, [image]))
+        else:
+            future = loop.create_future()
+            await self._queue.put((image, future))
+            result = await future
+        if isinstance(result, Exception):
+            raise result
+        return result
     
-    return xml_path
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.timeout
+            while len(batch) < self.max_size:
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+            # Dispatch without waiting so the next batch can fill meanwhile
+            task = asyncio.create_task(self._dispatch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+    
+    async def _dispatch(self, batch: List[tuple]):
+        images = [image for image, _ in batch]
+        try:
+            results = await asyncio.wrap_future(pool_submit(process_images_ocr, images))
+        except Exception as e:
+            results = [ConversionError(f"Failed to process image: {str(e)}")] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+ocr_batcher = OcrBatcher()
+
+def _write_xml_rows(f: BinaryIO, row_tag: str, tags: List[str], rows: Iterable[Iterable[Any]]):
+    """Write one row_tag element per row with a child element per column"""
+    row_start, row_end = f"<{row_tag}>", f"</{row_tag}>"
+    for values in rows:
+        parts = [row_start]
+        for tag, value in zip(tags, values):
+            text = escape(str(value))
+            parts.append(f"<{tag}>{text}</{tag}>" if text else f"<{tag}/>")
+        if len(parts) == 1:
+            f.write(f"<{row_tag}/>".encode())
+            continue
+        parts.append(row_end)
+        f.write("".join(parts).encode('utf-8', 'xmlcharrefreplace'))
+
+# Fixed scaffold of a Tally import envelope around the REQUESTDATA rows
+_TALLY_XML_PREFIX = (
+    b'<?xml version="1.0" encoding="utf-8"?>\n'
+    b'<ENVELOPE><HEADER><VERSION>1</VERSION><TALLYREQUEST>Import Data</TALLYREQUEST></HEADER>'
+    b'<BODY><IMPORTDATA><REQUESTDESC><REPORTNAME>Custom</REPORTNAME></REQUESTDESC><REQUESTDATA>'
+)
+_TALLY_XML_SUFFIX = b'</REQUESTDATA></IMPORTDATA></BODY></ENVELOPE>'
+
+def write_tally_xml(filepath: str, headers: List[Any], rows: Iterable[Iterable[Any]]):
+    """Stream a Tally import envelope to disk without building an element tree"""
+    tags = [str(header) for header in headers]
+    with open(filepath, 'wb') as f:
+        f.write(_TALLY_XML_PREFIX)
+        _write_xml_rows(f, "TALLYMESSAGE", tags, rows)
+        f.write(_TALLY_XML_SUFFIX)
+
+# Fixed parts of a minimal single-sheet workbook
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        b'<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        b'<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        b'<Default Extension="xml" ContentType="application/xml"/>'
+        b'<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        b'<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        b'</Types>'
+    ),
+    '_rels/.rels': (
+        b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        b'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        b'<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        b'</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        b'<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        b'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        b'<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        b'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        b'<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        b'</Relationships>'
+    ),
+}
+
+# Control characters XML 1.0 can't represent, even escaped
+_XML_ILLEGAL_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+def _xlsx_column(n: int) -> str:
+    """Spreadsheet column letters of 0-based column n"""
+    letters = ''
+    n += 1
+    while n:
+        n, rem = divmod(n - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+def _xlsx_cell(column: str, r: int, value: Any) -> str:
+    # Cells carry their reference since missing values are left out
+    if value is None:
+        return ''
+    if isinstance(value, (bool, np.bool_)):
+        return f'<c r="{column}{r}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (float, np.floating)) and not math.isfinite(value):
+        return ''
+    if isinstance(value, (int, float, np.number)):
+        return f'<c r="{column}{r}"><v>{value}</v></c>'
+    text = escape(_XML_ILLEGAL_CHARS.sub('', str(value)))
+    if text != text.strip():
+        return f'<c r="{column}{r}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+    return f'<c r="{column}{r}" t="inlineStr"><is><t>{text}</t></is></c>'
+
+def _write_xlsx_inline(filepath: str, headers: List[Any], rows: Iterable[List[Any]]):
+    """Zip up a single-sheet workbook with its rows written as inline strings"""
+    with zipfile.ZipFile(filepath, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        for name, data in _XLSX_PARTS.items():
+            zf.writestr(name, data)
+        with zf.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as f:
+            f.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            columns = [_xlsx_column(n) for n in range(len(headers))]
+            for r, values in enumerate(chain([headers], rows), 1):
+                cells = "".join([_xlsx_cell(column, r, value) for column, value in zip(columns, values)])
+                f.write(f'<row r="{r}">{cells}</row>'.encode('utf-8', 'xmlcharrefreplace'))
+            f.write(b'</sheetData></worksheet>')
+
+def write_xlsx(filepath: str, headers: List[Any], rows: Iterable[List[Any]]):
+    """Write a single-sheet workbook straight from row values"""
+    if isinstance(rows, list) and len(rows) > XLSX_STREAM_ROWS:
+        _write_xlsx_inline(filepath, headers, rows)
+    elif ExcelWorkbook is not None:
+        wb = ExcelWorkbook()
+        wb.new_sheet('Sheet1', data=[list(headers)] + list(rows))
+        wb.save(filepath)
+    else:
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet('Sheet1')
+        ws.append(list(headers))
+        for row in rows:
+            ws.append(row)
+        wb.save(filepath)
+
+def write_csv(filepath: str, df: pd.DataFrame):
+    """Write a DataFrame as CSV, through Arrow's C++ writer when available"""
+    if pa is not None:
+        try:
+            # Built column by column so duplicate or missing headers are fine
+            table = pa.Table.from_arrays(
+                [pa.array(df.iloc[:, i], from_pandas=True) for i in range(df.shape[1])],
+                names=[str(i) for i in range(df.shape[1])]
+            )
+        except pa.ArrowException:
+            # Mixed-type columns Arrow can't infer a type for
+            table = None
+        # Arrow spells numbers and booleans differently from pandas, so it
+        # only writes tables of text
+        text_types = (pa.types.is_string, pa.types.is_large_string, pa.types.is_null)
+        if table is not None and all(any(is_type(t) for is_type in text_types) for t in table.schema.types):
+            with open(filepath, 'wb') as f:
+                # Header line exactly as pandas writes it
+                f.write(df.head(0).to_csv(index=False).encode())
+                pacsv.write_csv(table, f, write_options=pacsv.WriteOptions(include_header=False))
+            return
+    df.to_csv(filepath, index=False)
+
+def dataframe_rows(df: pd.DataFrame) -> List[List[Any]]:
+    """Row values of a DataFrame with missing values as None"""
+    return df.astype(object).where(df.notna(), None).values.tolist()
+
+def table_cache_path(file_id: str) -> str:
+    return os.path.join(CACHE_DIR, f"{file_id}.parquet")
 
-def convert_file(file_path: str, file_id: str, output_formats: List[str] = ["xlsx", "csv", "xml"]) -> Dict:
-    """Convert file to specified formats"""
-    # Extract data based on file type
+def load_cached_table(file_id: str) -> Optional[pd.DataFrame]:
+    """The table parsed from an upload earlier, if still fresh"""
+    cache_path = table_cache_path(file_id)
+    try:
+        if time.time() - os.stat(cache_path).st_mtime > TABLE_CACHE_TTL:
+            return None
+        # Parquet keeps each column's dtype, so missing cells come back as
+        # the same None or NaN that extraction produced
+        return pd.read_parquet(cache_path)
+    except (OSError, ImportError, ValueError):
+        return None
+
+def cache_table(file_id: str, data: pd.DataFrame):
+    """Keep a parsed upload as Parquet so converting it again skips parsing"""
+    # Parquet would rename blank or duplicate headers, skip caching those
+    if data.columns.has_duplicates or not all(isinstance(header, str) for header in data.columns):
+        return
+    cache_path = table_cache_path(file_id)
+    tmp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        data.to_parquet(tmp_path, compression='zstd', index=False)
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        logger.info(f"Not caching table for {file_id}: {str(e)}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def clean_table_cache():
+    """Remove cached tables older than TABLE_CACHE_TTL"""
+    expired = time.time() - TABLE_CACHE_TTL
+    with os.scandir(CACHE_DIR) as entries:
+        for entry in entries:
+            try:
+                if entry.stat().st_mtime < expired:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                # Already removed by another server worker
+                pass
+    
+    # Forget the hashes of removed uploads once their table is gone too
+    for file_id, digest in list(UPLOAD_DIGESTS.items()):
+        if file_id not in UPLOADS and not os.path.exists(table_cache_path(digest)):
+            UPLOAD_DIGESTS.pop(file_id, None)
+
+async def expire_table_cache():
+    """Background task clearing out expired cached tables"""
+    while True:
+        await asyncio.to_thread(clean_table_cache)
+        await asyncio.sleep(TABLE_CACHE_TTL / 4)
+
+async def convert_upload(
+    file_path: Optional[str],
+    file_id: str,
+    digest: str,
+    output_formats: List[str],
+    pdf: Optional[PdfContext] = None,
+    image: Optional[bytes] = None
+) -> Dict:
+    """Convert an upload, reusing the table cached for its content"""
+    loop = asyncio.get_running_loop()
+    data = await asyncio.to_thread(load_cached_table, digest)
+    if data is not None:
+        return await loop.run_in_executor(None, convert_file, file_path, file_id, output_formats, data)
+    
+    if image is not None:
+        data = await ocr_batcher.ocr(image)
+    elif file_path is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    elif os.path.splitext(file_path)[1].lower() in IMAGE_EXTENSIONS:
+        data = await ocr_batcher.ocr(file_path)
+    else:
+        data = await loop.run_in_executor(None, extract_table, file_path, pdf)
+    _, result = await asyncio.gather(
+        asyncio.to_thread(cache_table, digest, data),
+        loop.run_in_executor(None, convert_file, file_path, file_id, output_formats, data)
+    )
+    return result
+
+def extract_table(file_path: str, pdf: Optional[PdfContext] = None) -> pd.DataFrame:
+    """Extract the table of an uploaded PDF or image, reusing an open PdfContext"""
     file_extension = os.path.splitext(file_path)[1].lower()
     if file_extension == '.pdf':
-        dataframes = extract_tables_from_pdf(file_path)
+        dataframes = list(pdf.tables() if pdf is not None else iter_pdf_tables(file_path))
         if not dataframes:
             raise ConversionError("No tables found in PDF")
+        if len(dataframes) == 1:
+            # Nothing to combine, and a page table already has a fresh
+            # index, so skip pd.concat's copy of every column
+            return dataframes[0]
         # Combine all tables into one if multiple tables found
-        data = pd.concat(dataframes, ignore_index=True)
-    elif file_extension in ['.png', '.jpg', '.jpeg']:
-        data = process_image_ocr(file_path)
+        return pd.concat(dataframes, ignore_index=True)
+    elif file_extension in IMAGE_EXTENSIONS:
+        return pool_submit(process_image_ocr, file_path).result()
     else:
         raise HTTPException(status_code=400, detail="Unsupported file format")
+
+def convert_file(
+    file_path: Optional[str],
+    file_id: str,
+    output_formats: List[str] = ["xlsx", "csv", "xml"],
+    data: Optional[pd.DataFrame] = None,
+    pdf: Optional[PdfContext] = None
+) -> Dict:
+    """Convert file to specified formats, from data when already extracted"""
+    if data is None:
+        data = extract_table(file_path, pdf)
     
-    # Convert to requested formats
+    # Convert to requested formats side by side; xlsx is pure-Python and
+    # CPU-bound so it gets a pool process, the others share `data` in threads.
+    # Each call writes to its own temp files and renames them into place
+    # once complete, so concurrent conversions of one file_id never leave
+    # a half-written output
     output_files = {}
+    tmp_files = {}
+    writes = []
+    suffix = f".{uuid.uuid4().hex}.tmp"
     
-    for format in output_formats:
+    # A format listed twice would start two writers on one temp file
+    for format in dict.fromkeys(output_formats):
         output_path = os.path.join(CONVERTED_DIR, f"{file_id}.{format}")
+        tmp_path = output_path + suffix
         
         if format == 'xlsx':
-            data.to_excel(output_path, index=False)
-            output_files['xlsx'] = output_path
+            writes.append(pool_submit(write_xlsx, tmp_path, data.columns.tolist(), dataframe_rows(data)))
         elif format == 'csv':
-            data.to_csv(output_path, index=False)
-            output_files['csv'] = output_path
+            writes.append(writer_pool.submit(write_csv, tmp_path, data))
         elif format == 'xml':
-            xml_path = create_tally_xml(data, file_id)
-            output_files['xml'] = xml_path
+            writes.append(writer_pool.submit(save_as_xml, data, tmp_path))
+        else:
+            continue
+        output_files[format] = output_path
+        tmp_files[format] = tmp_path
     
     # Prepare data for frontend
     headers = data.columns.tolist()
-    rows = []
-    for _, row in data.iterrows():
-        row_dict = {}
-        for col in headers:
-            row_dict[col] = str(row[col])
-        rows.append(row_dict)
+    rows = [dict(zip(headers, values)) for values in data.to_numpy(dtype=str).tolist()]
+    
+    wait(writes)
+    try:
+        for write in writes:
+            write.result()  # Re-raise the first failed write
+        for format, tmp_path in tmp_files.items():
+            os.replace(tmp_path, output_files[format])
+    finally:
+        for tmp_path in tmp_files.values():
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
 
     return {
         "status": "success",
@@ -311,51 +1037,55 @@ def convert_file(file_path: str, file_id: str, output_formats: List[str] = ["xls
 @app.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
     """Upload a file and return its ID"""
-    # Validate file size (e.g., 100MB limit)
-    if await file.read(1) == b'':
-        raise HTTPException(status_code=400, detail="Empty file")
-    await file.seek(0)  # Reset file pointer
-    
-    # Validate file type
+    # Validate file type before anything touches disk
     file_extension = os.path.splitext(file.filename)[1].lower()
-    if file_extension not in ['.pdf', '.png', '.jpg', '.jpeg']:
+    if file_extension not in UPLOAD_EXTENSIONS:
         raise HTTPException(status_code=400, detail="Unsupported file format")
     
-    try:
-        file_path, file_id = await save_upload_file(file)
-        return JSONResponse({
-            "status": "success",
-            "message": "File uploaded successfully",
-            "file_id": file_id
-        })
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    # The multipart parser already counted the bytes it spooled
+    if file.size == 0:
+        raise HTTPException(status_code=400, detail="Empty file")
+    
+    file_path, file_id = await save_upload_file(file)
+    if file.size is None and os.path.getsize(file_path) == 0:
+        # No size from the parser, check what was actually written
+        remove_upload(file_id, file_path)
+        raise HTTPException(status_code=400, detail="Empty file")
+    
+    return ORJSONResponse({
+        "status": "success",
+        "message": "File uploaded successfully",
+        "file_id": file_id
+    })
 
 @app.post("/convert/{file_id}")
 async def convert_uploaded_file(
     file_id: str,
-    output_formats: List[str] = ["xlsx", "csv", "xml"]
+    output_formats: List[str] = ["xlsx", "csv", "xml"],
+    pdf: Optional[PdfContext] = Depends(get_pdf_context)
 ):
     """Convert an already uploaded file"""
     try:
         # Find the uploaded file
-        for ext in ['.pdf', '.png', '.jpg', '.jpeg']:
-            file_path = os.path.join(UPLOAD_DIR, f"{file_id}{ext}")
-            if os.path.exists(file_path):
-                result = convert_file(file_path, file_id, output_formats)
-                # Clean up uploaded file after conversion
-                os.remove(file_path)
-                return JSONResponse(result)
+        file_path = pdf.file_path if pdf is not None else find_upload(file_id)
         
-        raise HTTPException(status_code=404, detail="File not found")
+        digest = await upload_digest(file_id, file_path)
+        result = await convert_upload(file_path, file_id, digest, output_formats, pdf)
+        
+        # Clean up uploaded file after conversion
+        if pdf is not None:
+            pdf.close()
+        if file_path is not None:
+            remove_upload(file_id, file_path)
+        return ORJSONResponse(result)
         
     except ConversionError as e:
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=400,
             content={"status": "error", "message": str(e)}
         )
     except Exception as e:
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=500,
             content={"status": "error", "message": f"Internal server error: {str(e)}"}
         )
@@ -367,107 +1097,137 @@ async def convert_new_file(
 ):
     """Convert a new file upload"""
     try:
-        # Save uploaded file
-        file_path, file_id = await save_upload_file(file)
-        
-        # Convert the file
-        result = convert_file(file_path, file_id, output_formats)
+        file_extension = os.path.splitext(file.filename)[1].lower()
         
-        # Clean up uploaded file
-        os.remove(file_path)
+        if file_extension in IMAGE_EXTENSIONS:
+            # Images are OCR'd straight from memory, nothing touches disk
+            contents = await file.read()
+            file_id = str(uuid.uuid4())
+            digest = (await asyncio.to_thread(hashlib.sha256, contents)).hexdigest()
+            result = await convert_upload(None, file_id, digest, output_formats, image=contents)
+        else:
+            # Save uploaded file
+            file_path, file_id = await save_upload_file(file)
+            
+            # Convert the file off the event loop
+            result = await convert_upload(file_path, file_id, UPLOAD_DIGESTS[file_id], output_formats)
+            
+            # Clean up uploaded file
+            remove_upload(file_id, file_path)
         
-        return JSONResponse(result)
+        return ORJSONResponse(result)
         
     except ConversionError as e:
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=400,
             content={"status": "error", "message": str(e)}
         )
     except Exception as e:
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=500,
             content={"status": "error", "message": f"Internal server error: {str(e)}"}
         )
 
+class DownloadResponse(FileResponse):
+    """FileResponse streaming in 1MB chunks"""
+    chunk_size = 1024 * 1024
+
+
+def file_response(
+    request: Request,
+    file_path: str,
+    media_type: Optional[str] = None,
+    filename: Optional[str] = None
+) -> Response:
+    """Serve a file from a single stat, answering conditional requests with 304"""
+    try:
+        file_stat = os.stat(file_path)
+    except OSError:
+        file_stat = None
+    if file_stat is None or not stat.S_ISREG(file_stat.st_mode):
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    # Exports can be regenerated under the same name, so browsers must
+    # revalidate every time; unchanged files then cost a 304 only
+    etag = f'"{file_stat.st_mtime_ns:x}-{file_stat.st_size:x}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+    
+    if media_type is None:
+        media_type = mimetypes.guess_type(filename or file_path)[0] or "text/plain"
+    
+    return DownloadResponse(
+        file_path,
+        media_type=media_type,
+        filename=filename,
+        headers=headers,
+        stat_result=file_stat
+    )
+
 @app.get("/download/{filename}")
-async def download_file(filename: str):
+async def download_file(filename: str, request: Request):
     """Download converted file"""
-    file_path = os.path.join(CONVERTED_DIR, filename)
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(file_path)
+    return file_response(request, os.path.join(CONVERTED_DIR, filename))
 
 def ensure_directory(path: str):
     if not os.path.exists(path):
         os.makedirs(path)
 
-def save_as_xlsx(data: TableData, filepath: str):
-    # Convert to pandas DataFrame
-    rows_data = []
-    for row in data.rows:
-        row_dict = {header: row.cells[header].value for header in data.headers}
-        rows_data.append(row_dict)
-    
-    df = pd.DataFrame(rows_data, columns=data.headers)
-    df.to_excel(filepath, index=False)
+def save_as_csv(df: pd.DataFrame, filepath: str):
+    write_csv(filepath, df)
 
-def save_as_csv(data: TableData, filepath: str):
-    # Convert to pandas DataFrame
-    rows_data = []
-    for row in data.rows:
-        row_dict = {header: row.cells[header].value for header in data.headers}
-        rows_data.append(row_dict)
-    
-    df = pd.DataFrame(rows_data, columns=data.headers)
-    df.to_csv(filepath, index=False)
+def save_as_xml(df: pd.DataFrame, filepath: str):
+    write_tally_xml(filepath, df.columns, df.itertuples(index=False, name=None))
 
-def save_as_xml(data: TableData, filepath: str):
-    root = ET.Element("ENVELOPE")
-    header = ET.SubElement(root, "HEADER")
-    ET.SubElement(header, "VERSION").text = "1"
-    ET.SubElement(header, "TALLYREQUEST").text = "Import Data"
-    
-    body = ET.SubElement(root, "BODY")
-    importdata = ET.SubElement(body, "IMPORTDATA")
-    requestdesc = ET.SubElement(importdata, "REQUESTDESC")
-    reportname = ET.SubElement(requestdesc, "REPORTNAME").text = "Custom"
-    
-    requestdata = ET.SubElement(importdata, "REQUESTDATA")
-    
-    # Convert rows to XML structure
-    for row in data.rows:
-        tallymessage = ET.SubElement(requestdata, "TALLYMESSAGE")
-        for header in data.headers:
-            ET.SubElement(tallymessage, str(header)).text = str(row.cells[header].value)
-    
-    # Save XML file
-    tree = ET.ElementTree(root)
-    tree.write(filepath, encoding='utf-8', xml_declaration=True)
+def write_json(filepath: str, content: Any):
+    with open(filepath, 'wb') as f:
+        f.write(orjson.dumps(content, option=orjson.OPT_INDENT_2))
+
+_VOUCHER_XML_PREFIX = b'<?xml version="1.0" encoding="utf-8"?>\n<ENVELOPE><TALLYMESSAGE>'
+_VOUCHER_XML_SUFFIX = b'</TALLYMESSAGE></ENVELOPE>'
+
+def write_voucher_xml(filepath: str, headers: List[str], rows: List[List[Any]]):
+    """Write edited rows as Tally vouchers, one element per column"""
+    tags = [header.upper().replace(' ', '_') for header in headers]
+    with open(filepath, 'wb') as f:
+        f.write(_VOUCHER_XML_PREFIX)
+        _write_xml_rows(f, 'VOUCHER', tags, rows)
+        f.write(_VOUCHER_XML_SUFFIX)
 
 def log_changes(file_id: str, edit_history: List[EditHistory]):
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    log_dir = "logs"
-    ensure_directory(log_dir)
-    
-    log_file = os.path.join(log_dir, f"{file_id}_{timestamp}_changes.json")
-    with open(log_file, "w") as f:
-        json.dump([edit.dict() for edit in edit_history], f, indent=2)
+    """Write an edit history to the logs directory (runs after the response is sent)"""
+    try:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        log_dir = "logs"
+        ensure_directory(log_dir)
+        
+        log_file = os.path.join(log_dir, f"{file_id}_{timestamp}_changes.json")
+        with open(log_file, "wb") as f:
+            f.write(orjson.dumps([edit.dict() for edit in edit_history], option=orjson.OPT_INDENT_2))
+    except Exception as e:
+        logger.error(f"Error logging changes for {file_id}: {str(e)}")
 
 @app.post("/api/save-edits")
-async def save_edits(payload: SavePayload):
+async def save_edits(payload: SavePayload, background_tasks: BackgroundTasks):
     try:
         # Ensure the corrected directory exists
         corrected_dir = "corrected"
         ensure_directory(corrected_dir)
         
-        # Save in different formats
+        # Save in different formats concurrently; xlsx is CPU-bound
         base_path = os.path.join(corrected_dir, f"{payload.fileId}_corrected")
-        save_as_xlsx(payload.modifiedData, f"{base_path}.xlsx")
-        save_as_csv(payload.modifiedData, f"{base_path}.csv")
-        save_as_xml(payload.modifiedData, f"{base_path}.xml")
+        modified = payload.modifiedData
+        df = modified.to_dataframe()
+        await asyncio.gather(
+            asyncio.wrap_future(pool_submit(write_xlsx, f"{base_path}.xlsx", modified.headers, modified.to_rows())),
+            asyncio.to_thread(save_as_csv, df, f"{base_path}.csv"),
+            asyncio.to_thread(save_as_xml, df, f"{base_path}.xml")
+        )
         
-        # Log the changes
-        log_changes(payload.fileId, payload.editHistory)
+        # Log the changes once the response is on its way
+        background_tasks.add_task(log_changes, payload.fileId, payload.editHistory)
         
         return {
             "success": True,
@@ -481,15 +1241,13 @@ async def save_edits(payload: SavePayload):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/download/{file_id}/{format}")
-async def download_file(file_id: str, format: str):
+async def download_file(file_id: str, format: str, request: Request):
     if format not in ["xlsx", "csv", "xml"]:
         raise HTTPException(status_code=400, detail="Invalid format")
     
     file_path = f"corrected/{file_id}_corrected.{format}"
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="File not found")
-    
-    return FileResponse(
+    return file_response(
+        request,
         file_path,
         media_type={
             "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
@@ -504,11 +1262,13 @@ async def list_files():
     """List all uploaded files"""
     try:
         files = []
-        for filename in os.listdir(UPLOAD_DIR):
-            file_path = os.path.join(UPLOAD_DIR, filename)
-            if os.path.isfile(file_path):
+        with os.scandir(UPLOAD_DIR) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                filename = entry.name
                 file_id = os.path.splitext(filename)[0]
-                file_stats = os.stat(file_path)
+                file_stats = entry.stat()
                 mime_type, _ = mimetypes.guess_type(filename)
                 
                 files.append({
@@ -528,74 +1288,108 @@ async def list_files():
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/files/{filename}")
-async def serve_file(filename: str):
+async def serve_file(filename: str, request: Request):
     """Serve an uploaded file"""
     file_path = os.path.join(UPLOAD_DIR, filename)
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="File not found")
-    
     mime_type, _ = mimetypes.guess_type(filename)
-    return FileResponse(
+    return file_response(
+        request,
         file_path,
         media_type=mime_type or "application/octet-stream",
         filename=filename
     )
 
+# Common OCR mix-ups flagged by validate_table: a letter O/l/S touching
+# a digit, or a digit 0/1/5 inside a word. Plain amounts and codes like
+# INV10 stay unflagged
+OCR_CONFUSION_PATTERN = re.compile(r'\d[OlS]|[OlS]\d|[A-Za-z][015][A-Za-z]')
+
+def _parse_failures(values: pd.Series, parsed: pd.Series, parse) -> np.ndarray:
+    """Confirm vectorized parse failures with the exact Python parser"""
+    failed = parsed.isna().to_numpy(copy=True)
+    for idx in np.flatnonzero(failed):
+        try:
+            parse(values.iat[idx])
+            failed[idx] = False
+        except ValueError:
+            pass
+    return failed
+
 def validate_table(data: List[List[str]]) -> List[Dict]:
     """Validate table data and return validation results"""
     validation_results = []
     
-    for row_idx, row in enumerate(data):
-        for col_idx, cell in enumerate(row):
-            # Skip header row
-            if row_idx == 0:
-                continue
-                
-            # Validate empty mandatory fields
-            if not cell.strip() and col_idx in [0, 1, 2]:  # Assuming first 3 columns are mandatory
-                validation_results.append({
-                    "row": row_idx,
-                    "column": col_idx,
-                    "type": "error",
-                    "severity": "critical",
-                    "message": "Mandatory field cannot be empty"
-                })
-            
-            # Validate numeric values
-            if col_idx in [3, 4]:  # Assuming columns 4 and 5 should be numeric
-                try:
-                    float(cell.replace(',', '').strip())
-                except ValueError:
-                    validation_results.append({
-                        "row": row_idx,
-                        "column": col_idx,
-                        "type": "error",
-                        "severity": "critical",
-                        "message": "Value must be numeric"
-                    })
-            
-            # Validate date format
-            if col_idx == 2:  # Assuming column 3 is date
-                try:
-                    datetime.strptime(cell.strip(), '%Y-%m-%d')
-                except ValueError:
-                    validation_results.append({
-                        "row": row_idx,
-                        "column": col_idx,
-                        "type": "error",
-                        "severity": "warning",
-                        "message": "Invalid date format (should be YYYY-MM-DD)"
-                    })
-            
-            # Check for common OCR errors
-            if any(char in cell for char in ['O0', 'l1', 'S5']):
-                validation_results.append({
-                    "row": row_idx,
-                    "column": col_idx,
-                    "type": "warning",
-                    "severity": "info",
-                    "message": "Possible OCR confusion (O/0, l/1, S/5)"
-                })
+    # Skip header row; cells missing from short rows are never flagged
+    cells = pd.DataFrame(data[1:], dtype=object)
+    if cells.empty:
+        return validation_results
+    present = cells.notna().to_numpy()
+    text = cells.where(cells.notna(), '').astype(str)
+    stripped = text.apply(lambda col: col.str.strip())
+    
+    shape = cells.shape
+    empty_mandatory = np.zeros(shape, dtype=bool)
+    not_numeric = np.zeros(shape, dtype=bool)
+    bad_date = np.zeros(shape, dtype=bool)
+    ocr_confusion = np.zeros(shape, dtype=bool)
+    
+    # Validate empty mandatory fields (assuming first 3 columns are mandatory)
+    for col_idx in [0, 1, 2]:
+        if col_idx < shape[1]:
+            empty_mandatory[:, col_idx] = (stripped[col_idx] == '').to_numpy()
+    
+    # Validate numeric values (assuming columns 4 and 5 should be numeric)
+    for col_idx in [3, 4]:
+        if col_idx < shape[1]:
+            values = stripped[col_idx].str.replace(',', '')
+            parsed = pd.to_numeric(values, errors='coerce')
+            not_numeric[:, col_idx] = _parse_failures(values, parsed, float)
+    
+    # Validate date format (assuming column 3 is date)
+    if shape[1] > 2:
+        parsed = pd.to_datetime(stripped[2], format='%Y-%m-%d', errors='coerce')
+        bad_date[:, 2] = _parse_failures(
+            stripped[2], parsed, lambda value: datetime.strptime(value, '%Y-%m-%d')
+        )
+    
+    # Check for common OCR errors
+    ocr_confusion[:] = text.apply(lambda col: col.str.contains(OCR_CONFUSION_PATTERN, regex=True)).to_numpy()
+    
+    flagged = (empty_mandatory | not_numeric | bad_date | ocr_confusion) & present
+    for row_idx, col_idx in np.argwhere(flagged).tolist():
+        row = row_idx + 1  # Account for the skipped header row
+        if empty_mandatory[row_idx, col_idx]:
+            validation_results.append({
+                "row": row,
+                "column": col_idx,
+                "type": "error",
+                "severity": "critical",
+                "message": "Mandatory field cannot be empty"
+            })
+        if not_numeric[row_idx, col_idx]:
+            validation_results.append({
+                "row": row,
+                "column": col_idx,
+                "type": "error",
+                "severity": "critical",
+                "message": "Value must be numeric"
+            })
+        if bad_date[row_idx, col_idx]:
+            validation_results.append({
+                "row": row,
+                "column": col_idx,
+                "type": "error",
+                "severity": "warning",
+                "message": "Invalid date format (should be YYYY-MM-DD)"
+            })
+        if ocr_confusion[row_idx, col_idx]:
+            validation_results.append({
+                "row": row,
+                "column": col_idx,
+                "type": "warning",
+                "severity": "info",
+                "message": "Possible OCR confusion (O/0, l/1, S/5)"
+            })
     
     return validation_results
 
@@ -608,8 +1402,8 @@ async def validate_data():
         if not os.path.exists(data_file):
             raise HTTPException(status_code=404, detail="No data available for validation")
         
-        with open(data_file, 'r') as f:
-            data = json.load(f)
+        with open(data_file, 'rb') as f:
+            data = orjson.loads(f.read())
         
         # Validate the data
         validation_results = validate_table(data['rows'])
@@ -626,7 +1420,7 @@ async def validate_data():
 async def save_edits(request: Request):
     """Save edited data and export in multiple formats"""
     try:
-        body = await request.json()
+        body = orjson.loads(await request.body())
         original_data = body['originalData']
         modified_data = body['modifiedData']
         edit_history = body['editHistory']
@@ -635,43 +1429,23 @@ async def save_edits(request: Request):
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         base_filename = f"corrected_{timestamp}"
         
-        # Save as JSON
-        json_path = os.path.join(CORRECTED_DIR, f"{base_filename}.json")
-        with open(json_path, 'w') as f:
-            json.dump({
-                'data': modified_data,
-                'editHistory': edit_history
-            }, f, indent=2)
-        
         # Convert to DataFrame
-        rows = []
-        for row in modified_data['rows']:
-            row_data = {}
-            for header in modified_data['headers']:
-                row_data[header] = row['cells'][header]['value']
-            rows.append(row_data)
-        df = pd.DataFrame(rows)
+        headers = modified_data['headers']
+        rows = [[row['cells'][header]['value'] for header in headers] for row in modified_data['rows']]
+        df = pd.DataFrame(rows, columns=headers, dtype=object)
         
-        # Save as Excel
+        json_path = os.path.join(CORRECTED_DIR, f"{base_filename}.json")
         excel_path = os.path.join(CORRECTED_DIR, f"{base_filename}.xlsx")
-        df.to_excel(excel_path, index=False)
-        
-        # Save as CSV
         csv_path = os.path.join(CORRECTED_DIR, f"{base_filename}.csv")
-        df.to_csv(csv_path, index=False)
-        
-        # Generate Tally XML
-        root = ET.Element('ENVELOPE')
-        msg = ET.SubElement(root, 'TALLYMESSAGE')
-        for row in rows:
-            voucher = ET.SubElement(msg, 'VOUCHER')
-            for key, value in row.items():
-                elem = ET.SubElement(voucher, key.upper().replace(' ', '_'))
-                elem.text = str(value)
-        
         xml_path = os.path.join(CORRECTED_DIR, f"{base_filename}.xml")
-        tree = ET.ElementTree(root)
-        tree.write(xml_path, encoding='utf-8', xml_declaration=True)
+        
+        # Save as JSON, Excel, CSV and Tally XML concurrently; xlsx is CPU-bound
+        await asyncio.gather(
+            asyncio.to_thread(write_json, json_path, {'data': modified_data, 'editHistory': edit_history}),
+            asyncio.wrap_future(pool_submit(write_xlsx, excel_path, headers, rows)),
+            asyncio.to_thread(save_as_csv, df, csv_path),
+            asyncio.to_thread(write_voucher_xml, xml_path, headers, rows)
+        )
         
         return {
             "status": "success",
@@ -690,26 +1464,28 @@ async def save_edits(request: Request):
 async def list_exports():
     """List all exported files"""
     try:
+        # Group the exported files by export in a single directory pass
+        exports: Dict[str, Dict[str, os.DirEntry]] = {}
+        with os.scandir(CORRECTED_DIR) as entries:
+            for entry in entries:
+                if not entry.name.startswith('corrected_') or not entry.is_file():
+                    continue
+                base_name, ext = os.path.splitext(entry.name)
+                exports.setdefault(base_name, {})[ext.lstrip('.')] = entry
+        
         files = []
-        for filename in os.listdir(CORRECTED_DIR):
-            if not filename.startswith('corrected_'):
-                continue
-                
-            base_name = os.path.splitext(filename)[0]
-            base_path = os.path.join(CORRECTED_DIR, base_name)
-            
+        for base_name, entries_by_ext in exports.items():
             # Get stats from any of the exported files (using .json as reference)
-            json_path = f"{base_path}.json"
-            if not os.path.exists(json_path):
+            json_entry = entries_by_ext.get('json')
+            if json_entry is None:
                 continue
                 
-            file_stats = os.stat(json_path)
+            file_stats = json_entry.stat()
             
             # Check which formats are available
             formats = {}
             for ext in ['json', 'xlsx', 'csv', 'xml']:
-                file_path = f"{base_path}.{ext}"
-                if os.path.exists(file_path):
+                if ext in entries_by_ext:
                     formats[ext.replace('xlsx', 'excel')] = f"/exports/{base_name}.{ext}"
             
             files.append({
@@ -729,39 +1505,45 @@ async def list_exports():
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/exports/{filename}")
-async def serve_export(filename: str):
+async def serve_export(filename: str, request: Request):
     """Serve an exported file"""
     file_path = os.path.join(CORRECTED_DIR, filename)
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="File not found")
-    
     mime_type, _ = mimetypes.guess_type(filename)
-    return FileResponse(
+    return file_response(
+        request,
         file_path,
         media_type=mime_type or "application/octet-stream",
         filename=filename
     )
 
 @app.get("/file/{file_id}")
-async def get_file(file_id: str):
+async def get_file(file_id: str, request: Request):
     """Get file by ID"""
-    # Check all possible file extensions
-    for ext in ['.pdf', '.png', '.jpg', '.jpeg']:
-        file_path = os.path.join(UPLOAD_DIR, f"{file_id}{ext}")
-        if os.path.exists(file_path):
-            # Get the MIME type based on file extension
-            mime_type, _ = mimetypes.guess_type(file_path)
-            if not mime_type:
-                mime_type = 'application/octet-stream'
-            
-            return FileResponse(
-                file_path,
-                media_type=mime_type,
-                filename=os.path.basename(file_path)
-            )
+    file_path = find_upload(file_id)
+    if file_path is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    # Get the MIME type based on file extension
+    mime_type, _ = mimetypes.guess_type(file_path)
+    if not mime_type:
+        mime_type = 'application/octet-stream'
     
-    raise HTTPException(status_code=404, detail="File not found")
+    return file_response(
+        request,
+        file_path,
+        media_type=mime_type,
+        filename=os.path.basename(file_path)
+    )
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=3001, reload=True) 
+    # uvloop has no Windows build; gunicorn's UvicornWorker and the plain
+    # uvicorn command pick up uvloop and httptools on their own when installed
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=3001,
+        reload=True,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools"
+    )
     
\ No newline at end of file
@@ -0,0 +1,43 @@
+import os
+import tempfile
+import pandas as pd
+
+def read_outputs(file_id):
+    outputs = {}
+    for format in ("xml", "csv"):
+        with open(os.path.join("converted", f"{file_id}.{format}")) as f:
+            outputs[format] = f.read()
+    outputs["xlsx"] = pd.read_excel(os.path.join("converted", f"{file_id}.xlsx"), na_filter=False).to_dict("records")
+    return outputs
+
+def test_cached_conversion():
+    # Converting from the table cache must write what the first conversion wrote
+    os.chdir(tempfile.mkdtemp())
+    import main
+
+    # An OCR line with fewer words than the header leaves a missing cell
+    words = pd.DataFrame({
+        "conf": [90] * 8,
+        "text": ["Name", "Amt", "Date", "Bob", "1.50", "Al", "2", "2024-01-01"],
+        "block_num": [1] * 8,
+        "par_num": [1] * 8,
+        "line_num": [1, 1, 1, 2, 2, 3, 3, 3]
+    })
+    tables = {
+        "ocr": main._words_to_table(words),
+        "pdf": pd.DataFrame([["a", None, "x"], [None, None, "1"]], columns=["A", "B", "C"])
+    }
+
+    formats = ["xlsx", "csv", "xml"]
+    for name, data in tables.items():
+        fresh = main.convert_file(None, f"{name}_fresh", formats, data)
+        main.cache_table(name, data)
+        cached = main.convert_file(None, f"{name}_cached", formats, main.load_cached_table(name))
+
+        print(f"\nTesting cached conversion of {name} table")
+        print(f"Rows: {cached['rows']}")
+        assert fresh["rows"] == cached["rows"]
+        assert read_outputs(f"{name}_fresh") == read_outputs(f"{name}_cached")
+
+if __name__ == "__main__":
+    test_cached_conversion()